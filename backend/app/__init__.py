@@ -1,9 +1,11 @@
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from app.db_routing import ReplicaRouter, RoutingSession, parse_replica_urls, replica_binds
+from app.response_cache import create_backend
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def create_app():
     """Application factory function"""
@@ -20,23 +22,80 @@ def create_app():
         'sqlite:///app.db'
     )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Optional read replicas for API GET requests
+    replica_urls = parse_replica_urls(os.environ.get('DATABASE_REPLICA_URLS'))
+    app.config['REPLICA_CONNECT_TIMEOUT'] = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', 2))
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(replica_urls, app.config['REPLICA_CONNECT_TIMEOUT'])
+    app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    app.config['REPLICA_LAG_CHECK_INTERVAL'] = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+
+    # Startup: set AUTO_CREATE_SCHEMA=false when `flask --app run init-db` runs as a one-shot job
+    app.config['AUTO_CREATE_SCHEMA'] = os.environ.get('AUTO_CREATE_SCHEMA', 'true').lower() in ('1', 'true', 'yes')
+    app.config['DB_POOL_WARM_CONNECTIONS'] = int(os.environ.get('DB_POOL_WARM_CONNECTIONS', 0))
+
+    # Open team: self-registration and requests without a login session
+    app.config['DEFAULT_TEAM_ID'] = int(os.environ.get('DEFAULT_TEAM_ID', 1))
+
+    # Response cache: 'local' (per process), 'shm' (shared by workers) or 'off'
+    app.config['RESPONSE_CACHE'] = os.environ.get('RESPONSE_CACHE', 'local')
+    app.config['RESPONSE_CACHE_DIR'] = os.environ.get('RESPONSE_CACHE_DIR', '/dev/shm/taskmanager-response-cache')
+
+    # Change feed only serves rows older than this, so late commits are not skipped
+    app.config['CHANGE_FEED_SETTLE_SECONDS'] = float(os.environ.get('CHANGE_FEED_SETTLE_SECONDS', 5))
+    app.config['CHANGE_FEED_RETENTION_DAYS'] = int(os.environ.get('CHANGE_FEED_RETENTION_DAYS', 30))
+
+    # Idempotency-Key storage for POST retries
+    app.config['IDEMPOTENCY_KEY_TTL'] = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+    app.config['IDEMPOTENCY_LOCK_TIMEOUT'] = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    app.config['IDEMPOTENCY_MAX_KEYS'] = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 100000))
     app.config['JSON_SORT_KEYS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')  # Signs the session cookie
 
     # Initialize extensions
     db.init_app(app)
     CORS(app)
+    app.extensions['replica_router'] = ReplicaRouter(
+        app.config['SQLALCHEMY_BINDS'],
+        max_lag=app.config['REPLICA_MAX_LAG_SECONDS'],
+        check_interval=app.config['REPLICA_LAG_CHECK_INTERVAL']
+    )
+    app.extensions['response_cache'] = create_backend(app)
 
     # Register blueprints
     from app.routes import main_bp, api_bp
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
 
-    # Create DB tables
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
+
     with app.app_context():
-        try:
-            db.create_all()
-            app.logger.info("Database tables created successfully")
-        except Exception as e:
-            app.logger.warning(f"Database init warning: {str(e)}")
+        # Create DB tables
+        if app.config['AUTO_CREATE_SCHEMA']:
+            try:
+                db.create_all(bind_key=None)  # Primary only, replicas follow it
+                app.logger.info("Database tables created successfully")
+            except Exception as e:
+                app.logger.warning(f"Database init warning: {str(e)}")
+
+        # Open pooled connections up front so the first requests don't pay for them
+        warm_pool(app, app.config['DB_POOL_WARM_CONNECTIONS'])
 
     return app
+
+
+def warm_pool(app, size):
+    """Check out and return `size` connections from the primary pool"""
+    connections = []
+    try:
+        for _ in range(size):
+            conn = db.engine.connect()
+            connections.append(conn)
+            conn.execute(db.text('SELECT 1'))
+    except Exception as e:
+        app.logger.warning(f"Database pool warm-up warning: {str(e)}")
+    finally:
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,122 @@
+"""
+Task change feed (GET /api/tasks/changes)
+
+A cursor marks a position in two streams: tasks ordered by
+(updated_at, id), served from ix_tasks_team_updated_at_id, and task
+tombstones ordered by (deleted_at, id). Clients keep the cursor from each
+response and pass it back as `since` to receive only what changed after it.
+
+updated_at and deleted_at are set in Python at flush time, but rows only
+become visible at commit. To avoid moving a cursor past a row that is
+still uncommitted, the feed only serves rows stamped at least
+CHANGE_FEED_SETTLE_SECONDS ago, and the feed always reads from the
+primary (a replica may not have replayed a committed row yet). Guarantee:
+a change is delivered as long as its transaction commits, and pod clocks
+agree, within that window.
+
+Tombstones older than CHANGE_FEED_RETENTION_DAYS are deleted by
+`flask --app run prune-task-tombstones`. A cursor whose tombstone position
+is older than that may have missed deletes and is rejected with
+CursorExpired; the client then syncs again from scratch.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import tuple_
+from app import db
+from app.models import Task, TaskTombstone
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    """Raised when a `since` cursor cannot be decoded"""
+
+
+class CursorExpired(ValueError):
+    """Raised when tombstones after a cursor may already have been pruned"""
+
+
+def _retention_cutoff():
+    return datetime.utcnow() - timedelta(days=current_app.config['CHANGE_FEED_RETENTION_DAYS'])
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def encode_cursor(updated_at, task_id, deleted_at, tombstone_id):
+    """Build an opaque cursor string"""
+    payload = {
+        'u': _iso(updated_at),
+        'i': task_id,
+        'du': _iso(deleted_at),
+        'di': tombstone_id
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (updated_at, task_id, deleted_at, tombstone_id); empty means start of feed"""
+    if not cursor:
+        return None, 0, None, 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return _parse(payload['u']), int(payload['i']), _parse(payload['du']), int(payload['di'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def get_task_changes(cursor, limit=DEFAULT_LIMIT):
+    """Return tasks changed and task ids deleted after the cursor"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    updated_at, task_id, deleted_at, tombstone_id = decode_cursor(cursor)
+    if cursor and (deleted_at is None or deleted_at < _retention_cutoff()):
+        raise CursorExpired(cursor)
+    horizon = datetime.utcnow() - timedelta(seconds=current_app.config['CHANGE_FEED_SETTLE_SECONDS'])
+
+    query = Task.query.filter(Task.updated_at.isnot(None), Task.updated_at <= horizon)
+    if updated_at is not None:
+        query = query.filter(tuple_(Task.updated_at, Task.id) > tuple_(updated_at, task_id))
+    tasks = query.order_by(Task.updated_at, Task.id).limit(limit + 1).all()
+
+    query = TaskTombstone.query.filter(TaskTombstone.deleted_at <= horizon)
+    if deleted_at is not None:
+        query = query.filter(tuple_(TaskTombstone.deleted_at, TaskTombstone.id) > tuple_(deleted_at, tombstone_id))
+    tombstones = query.order_by(TaskTombstone.deleted_at, TaskTombstone.id).limit(limit + 1).all()
+
+    has_more = len(tasks) > limit or len(tombstones) > limit
+    more_tombstones = len(tombstones) > limit
+    tasks, tombstones = tasks[:limit], tombstones[:limit]
+    if tasks:
+        updated_at, task_id = tasks[-1].updated_at, tasks[-1].id
+    if tombstones:
+        deleted_at, tombstone_id = tombstones[-1].deleted_at, tombstones[-1].id
+    if not more_tombstones and (deleted_at is None or deleted_at < horizon):
+        # Every tombstone up to the horizon was served; advance so that the
+        # cursor only expires once the client stops syncing
+        deleted_at, tombstone_id = horizon, 0
+
+    return {
+        'tasks': [task.to_dict() for task in tasks],
+        'deleted': [tombstone.task_id for tombstone in tombstones],
+        'cursor': encode_cursor(updated_at, task_id, deleted_at, tombstone_id),
+        'has_more': has_more
+    }
+
+
+def prune_task_tombstones():
+    """Delete tombstones older than CHANGE_FEED_RETENTION_DAYS; return rows deleted"""
+    deleted = TaskTombstone.query.filter(
+        TaskTombstone.deleted_at < _retention_cutoff()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,63 @@
+"""
+Flask CLI commands (run with `flask --app run <command>`)
+"""
+import click
+
+
+def register_commands(app):
+    """Register maintenance commands on the app"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing database tables (run once per deploy)"""
+        from app import db
+        db.create_all(bind_key=None)
+        click.echo("Database tables created")
+
+    @app.cli.command('create-team')
+    @click.option('--username', required=True, help='Username of the team lead')
+    @click.option('--email', required=True)
+    @click.option('--full-name', required=True)
+    @click.password_option(help='Initial password of the team lead')
+    def create_team_command(username, email, full_name, password):
+        """Provision a new team with its first team lead"""
+        from app import db
+        from app.models import User
+        # Never reuse the default team, which anyone can join through /register
+        highest = db.session.query(db.func.max(User.team_id)).scalar() or 0
+        team_id = max(highest, app.config['DEFAULT_TEAM_ID']) + 1
+        db.session.add(User(
+            team_id=team_id, username=username, email=email,
+            full_name=full_name, role='lead', password=password
+        ))
+        db.session.commit()
+        click.echo(f"Created team {team_id} with lead {username}")
+
+    @app.cli.command('rebuild-task-stats')
+    def rebuild_task_stats_command():
+        """Rebuild the user_task_stats table from scratch"""
+        from app.stats import rebuild_user_task_stats
+        users = rebuild_user_task_stats()
+        click.echo(f"Rebuilt task stats for {users} users")
+
+    @app.cli.command('rollup-tasks')
+    @click.option('--rebuild', is_flag=True, help='Recompute every bucket instead of only recent ones')
+    def rollup_tasks_command(rebuild):
+        """Refresh the task_rollups time-series table"""
+        from app.rollups import run_task_rollups
+        rows = run_task_rollups(rebuild=rebuild)
+        click.echo(f"Wrote {rows} task rollup rows")
+
+    @app.cli.command('prune-task-tombstones')
+    def prune_task_tombstones_command():
+        """Delete task tombstones older than CHANGE_FEED_RETENTION_DAYS"""
+        from app.changes import prune_task_tombstones
+        deleted = prune_task_tombstones()
+        click.echo(f"Deleted {deleted} task tombstones")
+
+    @app.cli.command('sweep-idempotency-keys')
+    def sweep_idempotency_keys_command():
+        """Delete expired idempotency keys and cap the table size"""
+        from app.idempotency import sweep_idempotency_keys
+        expired, overflow = sweep_idempotency_keys()
+        click.echo(f"Deleted {expired} expired and {overflow} overflow idempotency keys")
@@ -0,0 +1,148 @@
+"""
+Read-replica routing for the API
+
+When DATABASE_REPLICA_URLS is set, every replica is registered as a
+Flask-SQLAlchemy bind named ``replica_<n>``. RoutingSession sends plain
+SELECTs issued while handling a GET/HEAD request on the ``api`` blueprint
+to one replica (round-robin per request, sticky for the rest of that
+request). Everything else - writes, flushes, raw SQL and all reads that
+happen after a write in the same request - goes to the primary.
+
+A background thread in each worker process checks every replica's
+replication lag every REPLICA_LAG_CHECK_INTERVAL seconds, so requests
+never wait on a probe. A replica is skipped until its first check passes,
+and from the start of any check until that check passes again; it fails
+when it lags more than REPLICA_MAX_LAG_SECONDS or cannot be reached within
+REPLICA_CONNECT_TIMEOUT seconds. With no healthy replica, reads fall back
+to the primary.
+"""
+import itertools
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+
+READ_METHODS = ('GET', 'HEAD')
+READ_BLUEPRINTS = ('api',)
+
+# Lag in seconds on a streaming replica, 0 when fully replayed or on a primary
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+def parse_replica_urls(value):
+    """Split a comma separated DATABASE_REPLICA_URLS value"""
+    return [url.strip() for url in (value or '').split(',') if url.strip()]
+
+
+def replica_binds(urls, connect_timeout=2):
+    """Map replica URLs to SQLALCHEMY_BINDS entries"""
+    binds = {}
+    for index, url in enumerate(urls):
+        options = {'url': url}
+        if url.startswith('postgresql'):
+            options['connect_args'] = {'connect_timeout': connect_timeout}
+        binds[f'replica_{index}'] = options
+    return binds
+
+
+class ReplicaRouter:
+    """Round-robin replica picker with lag-aware health checks"""
+
+    def __init__(self, bind_keys, max_lag=5.0, check_interval=5.0):
+        self.bind_keys = list(bind_keys)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(self.bind_keys) if self.bind_keys else None
+        self._lock = threading.Lock()
+        self._healthy = {key: False for key in self.bind_keys}
+        self._checker_pid = None
+
+    def measure_lag(self, engine):
+        """Return replication lag in seconds for an engine"""
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                return float(conn.execute(POSTGRES_LAG_SQL).scalar() or 0)
+            conn.execute(text('SELECT 1'))
+            return 0.0
+
+    def check(self, key, engine, logger):
+        """Probe one replica; it is skipped while the probe runs"""
+        self._healthy[key] = False
+        try:
+            self._healthy[key] = self.measure_lag(engine) <= self.max_lag
+        except Exception as e:
+            logger.warning(f"Replica {key} unavailable: {str(e)}")
+
+    def _run_checks(self, engines, logger):
+        while True:
+            for key in self.bind_keys:
+                self.check(key, engines[key], logger)
+            time.sleep(self.check_interval)
+
+    def _ensure_checker(self, engines):
+        # One checker per worker process; threads do not survive fork()
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+            self._healthy = {key: False for key in self.bind_keys}
+        engines = {key: engines[key] for key in self.bind_keys}
+        threading.Thread(
+            target=self._run_checks, args=(engines, current_app.logger),
+            name='replica-lag-checker', daemon=True
+        ).start()
+
+    def choose(self, engines):
+        """Pick the next healthy replica bind key, or None for the primary"""
+        if not self._cycle:
+            return None
+        self._ensure_checker(engines)
+        for _ in range(len(self.bind_keys)):
+            with self._lock:
+                key = next(self._cycle)
+            if self._healthy[key]:
+                return key
+        return None
+
+
+def use_primary():
+    """Serve the rest of the current request's reads from the primary"""
+    g.db_wrote = True
+
+
+class RoutingSession(Session):
+    """Session that serves API GET reads from read replicas"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or not isinstance(clause, Select):
+                # Read-your-writes: pin the rest of the request to the primary
+                g.db_wrote = True
+            elif self._reads_from_replica():
+                key = self._request_replica()
+                if key is not None:
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self):
+        return (
+            request.method in READ_METHODS
+            and request.blueprint in READ_BLUEPRINTS
+            and not g.get('db_wrote', False)
+        )
+
+    def _request_replica(self):
+        if 'db_replica' not in g:
+            router = current_app.extensions.get('replica_router')
+            g.db_replica = router.choose(self._db.engines) if router else None
+        return g.db_replica
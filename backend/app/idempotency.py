@@ -0,0 +1,141 @@
+"""
+Idempotency-Key support for POST endpoints
+
+The first request with a given key claims it by inserting a row into
+idempotency_keys, runs the handler and stores the response. Retries with
+the same key and body get the stored response back without running the
+handler again. Keys are scoped per team and expire after IDEMPOTENCY_KEY_TTL seconds;
+`flask --app run sweep-idempotency-keys` deletes expired keys and caps
+the table at IDEMPOTENCY_MAX_KEYS rows.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from app.models import IdempotencyKey
+from app.tenancy import current_team_id
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+STORED_HEADERS = ('Content-Type', 'ETag', 'Location')
+MAX_CLIENT_KEY_LENGTH = 255
+
+
+def _sha256(value):
+    return hashlib.sha256(value).hexdigest()
+
+
+def _is_expired(record, now):
+    ttl = timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL'])
+    if record.status_code is None:
+        # A claim whose request never finished (worker crash) can be taken over
+        ttl = timedelta(seconds=current_app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+    return record.created_at < now - ttl
+
+
+def _replay(record):
+    headers = json.loads(record.response_headers or '{}')
+    headers[REPLAYED_HEADER] = 'true'
+    return Response(record.response_body, status=record.status_code, headers=headers)
+
+
+def idempotent(view):
+    """Make a POST handler safe to retry when the client sends Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get(HEADER)
+        if not client_key:
+            return view(*args, **kwargs)
+        if len(client_key) > MAX_CLIENT_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_CLIENT_KEY_LENGTH} characters'}), 400
+
+        key = _sha256(f'{current_team_id()}\n{request.path}\n{client_key}'.encode())
+        request_hash = _sha256(request.get_data())
+
+        record = db.session.get(IdempotencyKey, key)
+        if record is not None and _is_expired(record, datetime.utcnow()):
+            db.session.delete(record)
+            db.session.commit()
+            record = None
+
+        if record is not None:
+            if record.request_hash != request_hash:
+                return jsonify({'error': f'{HEADER} was already used with a different request'}), 422
+            if record.status_code is None:
+                return jsonify({'error': 'A request with this Idempotency-Key is in progress'}), 409
+            return _replay(record)
+
+        # Claim the key; a concurrent request with the same key loses the insert
+        try:
+            db.session.add(IdempotencyKey(key=key, request_hash=request_hash))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'A request with this Idempotency-Key is in progress'}), 409
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except HTTPException as e:
+            # e.g. 415/400 from request.get_json(): store it like a returned error
+            db.session.rollback()
+            _finish(key, e.get_response())
+            raise
+        except Exception:
+            db.session.rollback()
+            _release(key)
+            raise
+
+        _finish(key, response)
+        return response
+    return wrapper
+
+
+def _release(key):
+    """Drop a claim so the client can retry"""
+    IdempotencyKey.query.filter_by(key=key).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _finish(key, response):
+    """Store the response for replay, or release the claim after a server error"""
+    if response.status_code >= 500:
+        # Server errors are not stored so the client can retry
+        _release(key)
+        return
+    record = db.session.get(IdempotencyKey, key)
+    if record is not None:
+        record.status_code = response.status_code
+        record.response_body = response.get_data(as_text=True)
+        record.response_headers = json.dumps({
+            name: response.headers[name] for name in STORED_HEADERS if name in response.headers
+        })
+        db.session.commit()
+
+
+def sweep_idempotency_keys():
+    """Delete expired keys, then the oldest keys above the row cap"""
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(seconds=config['IDEMPOTENCY_KEY_TTL'])
+    expired = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+
+    overflow = 0
+    excess = IdempotencyKey.query.count() - config['IDEMPOTENCY_MAX_KEYS']
+    if excess > 0:
+        oldest = (
+            db.session.query(IdempotencyKey.key)
+            .order_by(IdempotencyKey.created_at)
+            .limit(excess)
+            .subquery()
+        )
+        overflow = IdempotencyKey.query.filter(
+            IdempotencyKey.key.in_(db.select(oldest.c.key))
+        ).delete(synchronize_session=False)
+
+    db.session.commit()
+    return expired, overflow
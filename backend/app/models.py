@@ -1,9 +1,36 @@
 from app import db
+from app.tenancy import team_id_for_insert
 from datetime import datetime
 
-class User(db.Model):
+
+class TeamScoped:
+    """Mixin for models partitioned by team (tenant)"""
+    team_id = db.Column(db.Integer, default=team_id_for_insert, nullable=False)
+
+
+def next_id(sequence, table):
+    """Column default for `id` in tables whose primary key is (team_id, id)
+
+    Postgres draws ids from the sequence, so they stay unique across teams
+    and the table can be partitioned by team_id. SQLite (local development)
+    has no sequences and takes MAX(id) + 1.
+    """
+    def default(context):
+        if context.dialect.supports_sequences:
+            return context.connection.scalar(db.select(sequence.next_value()))
+        return context.connection.scalar(db.text(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}'))
+    return default
+
+
+# Same names as the SERIAL sequences of databases created before (team_id, id) keys
+TASK_ID_SEQ = db.Sequence('tasks_id_seq', metadata=db.metadata)
+NOTIFICATION_ID_SEQ = db.Sequence('notifications_id_seq', metadata=db.metadata)
+
+
+class User(TeamScoped, db.Model):
     """User model for storing user information"""
     __tablename__ = 'users'
+    __table_args__ = (db.Index('ix_users_team_role', 'team_id', 'role'),)
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False, index=True)
@@ -27,6 +54,7 @@ class User(db.Model):
         """Convert user to dictionary"""
         return {
             'id': self.id,
+            'team_id': self.team_id,
             'username': self.username,
             'email': self.email,
             'full_name': self.full_name,
@@ -36,13 +64,13 @@ class User(db.Model):
         }
 
 
-class Task(db.Model):
+class Task(TeamScoped, db.Model):
     """Task model for storing user tasks"""
     __tablename__ = 'tasks'
     
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    assigned_to = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    id = db.Column(db.Integer, default=next_id(TASK_ID_SEQ, 'tasks'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    assigned_to = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     assigned_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -55,6 +83,24 @@ class Task(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     due_date = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
+    approved_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, default=1, nullable=False)  # Optimistic concurrency counter
+    
+    # Every ORM UPDATE checks and bumps the version; a concurrent write raises StaleDataError
+    __mapper_args__ = {'version_id_col': version}
+    # Queries are always scoped by team, so the primary key and every index
+    # lead on team_id; the change feed scans tasks in (updated_at, id) order
+    __table_args__ = (
+        db.PrimaryKeyConstraint('team_id', 'id'),
+        db.Index('ix_tasks_team_user_id', 'team_id', 'user_id'),
+        db.Index('ix_tasks_team_assigned_to', 'team_id', 'assigned_to'),
+        db.Index('ix_tasks_team_assigned_by', 'team_id', 'assigned_by'),
+        db.Index('ix_tasks_team_updated_at_id', 'team_id', 'updated_at', 'id'),
+        # Rollup worker scans recent events across all teams
+        db.Index('ix_tasks_created_at', 'created_at'),
+        db.Index('ix_tasks_completed_at', 'completed_at'),
+        db.Index('ix_tasks_approved_at', 'approved_at'),
+    )
     
     def __repr__(self):
         return f'<Task {self.title}>'
@@ -63,6 +109,7 @@ class Task(db.Model):
         """Convert task to dictionary"""
         return {
             'id': self.id,
+            'team_id': self.team_id,
             'user_id': self.user_id,
             'assigned_to': self.assigned_to,
             'assigned_by': self.assigned_by,
@@ -76,17 +123,34 @@ class Task(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'due_date': self.due_date.isoformat() if self.due_date else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'approved_at': self.approved_at.isoformat() if self.approved_at else None,
+            'version': self.version
         }
 
 
-class Notification(db.Model):
+class TaskTombstone(TeamScoped, db.Model):
+    """Record of a deleted task, served by the change feed"""
+    __tablename__ = 'task_tombstones'
+    __table_args__ = (db.Index('ix_task_tombstones_team_deleted_at_id', 'team_id', 'deleted_at', 'id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class Notification(TeamScoped, db.Model):
     """Notification model for task updates"""
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('team_id', 'id'),
+        db.ForeignKeyConstraint(['team_id', 'task_id'], ['tasks.team_id', 'tasks.id']),
+        db.Index('ix_notifications_team_user_created', 'team_id', 'user_id', 'created_at'),
+    )
     
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=True)
+    id = db.Column(db.Integer, default=next_id(NOTIFICATION_ID_SEQ, 'notifications'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    task_id = db.Column(db.Integer, nullable=True)
     message = db.Column(db.Text, nullable=False)
     read = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -101,3 +165,67 @@ class Notification(db.Model):
             'read': self.read,
             'created_at': self.created_at.isoformat()
         }
+
+
+class UserTaskStats(db.Model):
+    """Per-user task counters, maintained on every task write"""
+    __tablename__ = 'user_task_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    pending = db.Column(db.Integer, default=0, nullable=False)
+    in_progress = db.Column(db.Integer, default=0, nullable=False)
+    completed = db.Column(db.Integer, default=0, nullable=False)
+    approved = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert stats to dictionary"""
+        return {
+            'user_id': self.user_id,
+            'pending': self.pending,
+            'in_progress': self.in_progress,
+            'completed': self.completed,
+            'approved': self.approved,
+            'total': self.pending + self.in_progress + self.completed + self.approved
+        }
+
+
+class IdempotencyKey(db.Model):
+    """Stored response for a POST sent with an Idempotency-Key header"""
+    __tablename__ = 'idempotency_keys'
+    
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of team + request path + client key
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of request body
+    status_code = db.Column(db.Integer, nullable=True)  # NULL while the first request is in flight
+    response_body = db.Column(db.Text, nullable=True)
+    response_headers = db.Column(db.Text, nullable=True)  # JSON of replayed headers
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class TaskRollup(TeamScoped, db.Model):
+    """Hourly/daily task aggregates per owner and priority, built by the rollup worker"""
+    __tablename__ = 'task_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('team_id', 'granularity', 'bucket_start', 'user_id', 'priority',
+                            name='uq_task_rollups_bucket'),
+        db.Index('ix_task_rollups_bucket_start', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)  # Task owner: assignee, else creator
+    priority = db.Column(db.String(20), nullable=False)
+    created_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    approved_count = db.Column(db.Integer, default=0, nullable=False)
+    completion_seconds = db.Column(db.Float, default=0, nullable=False)  # Sum of created_at -> completed_at
+    approval_seconds = db.Column(db.Float, default=0, nullable=False)  # Sum of completed_at -> approved_at
+
+
+class RollupWatermark(db.Model):
+    """Start time of the last successful run of a rollup worker"""
+    __tablename__ = 'rollup_watermarks'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    processed_at = db.Column(db.DateTime, nullable=False)
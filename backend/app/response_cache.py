@@ -0,0 +1,225 @@
+"""
+Short-TTL response cache for hot, identical GET responses
+
+Responses are keyed by endpoint, team and the query arguments the view
+declares it reads; other arguments are ignored so clients cannot fill the
+cache with random query strings. Concurrent misses
+on the same key are coalesced: the first request renders the response
+while the others wait on a lock for that key and then read the cached copy.
+
+Backends (RESPONSE_CACHE):
+    local - per-process dict (default)
+    shm   - files in RESPONSE_CACHE_DIR (tmpfs such as /dev/shm), shared by
+            every worker process in the pod; locks use flock()
+    off   - no caching
+
+Write handlers call invalidate_responses(<group>) after committing; each
+group has a generation counter that is part of the key, so bumping it
+makes every cached response of that group unreachable.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, current_app, make_response, request
+
+from app.tenancy import current_team_id
+
+CACHE_HEADER = 'X-Cache'
+STORED_HEADERS = ('Content-Type', 'ETag')
+
+
+class LocalBackend:
+    """In-process cache; shared by the threads of one worker"""
+
+    max_entries = 1024
+    lock_stripes = 64
+
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None or item[0] < time.time():
+            return None
+        return item[1]
+
+    def set(self, key, entry, ttl):
+        with self._guard:
+            if len(self._entries) >= self.max_entries:
+                now = time.time()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (time.time() + ttl, entry)
+
+    def lock(self, key):
+        return self._locks[hash(key) % self.lock_stripes]
+
+    def generation(self, group):
+        return self._generations.get(group, 0)
+
+    def bump(self, group):
+        with self._guard:
+            self._generations[group] = self._generations.get(group, 0) + 1
+
+
+class SharedMemoryBackend:
+    """File cache on tmpfs; shared by every worker process on the host"""
+
+    sweep_probability = 0.01
+    lock_stripes = 64
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data):
+        tmp = self._path(f'.{name}.{os.getpid()}.{threading.get_ident()}')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(name))
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                meta = json.loads(f.readline())
+                if meta['expires'] < time.time():
+                    return None
+                return meta['status'], meta['headers'], f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, entry, ttl):
+        status, headers, body = entry
+        meta = json.dumps({'expires': time.time() + ttl, 'status': status, 'headers': headers})
+        self._write(key, meta.encode() + b'\n' + body)
+        if random.random() < self.sweep_probability:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries
+
+        Lock files are never removed: there is a fixed set of them, and
+        another worker may hold or be waiting on any one.
+        """
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.startswith(('.', 'gen-', 'lock-')):
+                continue
+            path = self._path(name)
+            try:
+                with open(path, 'rb') as f:
+                    expired = json.loads(f.readline())['expires'] < now
+                if expired:
+                    os.remove(path)
+            except (OSError, ValueError, KeyError):
+                pass
+
+    @contextmanager
+    def lock(self, key):
+        # crc32 rather than hash(): the stripe must be the same in every process
+        stripe = zlib.crc32(key.encode()) % self.lock_stripes
+        with open(self._path(f'lock-{stripe}'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def generation(self, group):
+        try:
+            with open(self._path(f'gen-{group}'), 'rb') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self, group):
+        with self.lock(f'gen-{group}'):
+            self._write(f'gen-{group}', str(self.generation(group) + 1).encode())
+
+
+def create_backend(app):
+    """Build the backend selected by RESPONSE_CACHE"""
+    kind = app.config['RESPONSE_CACHE']
+    if kind == 'shm':
+        return SharedMemoryBackend(app.config['RESPONSE_CACHE_DIR'])
+    if kind == 'local':
+        return LocalBackend()
+    return None
+
+
+def _group_name(group):
+    return f'{group}:{current_team_id()}'
+
+
+def _cache_key(backend, groups, args):
+    query = '&'.join(sorted(
+        f'{k}={v}' for k, v in request.args.items(multi=True) if k in args
+    ))
+    generations = ','.join(f'{g}={backend.generation(_group_name(g))}' for g in groups)
+    raw = f'{request.endpoint}\n{query}\n{current_team_id()}\n{generations}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _to_response(entry, state):
+    status, headers, body = entry
+    response = Response(body, status=status, headers=headers)
+    response.headers[CACHE_HEADER] = state
+    return response
+
+
+def cached_response(ttl, groups=(), args=()):
+    """Cache a GET view's 200 responses for `ttl` seconds
+
+    `args` names the query arguments the view reads; only those are part
+    of the cache key.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = current_app.extensions.get('response_cache')
+            if backend is None or request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            key = _cache_key(backend, groups, args)
+            entry = backend.get(key)
+            if entry is not None:
+                return _to_response(entry, 'HIT')
+
+            with backend.lock(key):
+                # Another request may have filled the entry while we waited
+                entry = backend.get(key)
+                if entry is not None:
+                    return _to_response(entry, 'HIT')
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+                    backend.set(key, (response.status_code, headers, response.get_data()), ttl)
+                response.headers[CACHE_HEADER] = 'MISS'
+                return response
+        return wrapper
+    return decorator
+
+
+def invalidate_responses(*groups):
+    """Drop cached responses of the given groups for the current team"""
+    backend = current_app.extensions.get('response_cache')
+    if backend is None:
+        return
+    for group in groups:
+        backend.bump(_group_name(group))
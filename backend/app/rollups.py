@@ -0,0 +1,139 @@
+"""
+Task time-series rollups (task_rollups table)
+
+`flask --app run rollup-tasks` is run on a schedule. Each run recomputes
+every hourly and daily bucket from the start of the day of the previous
+run (minus ROLLUP_LOOKBACK, to catch late commits) up to now, reading
+only tasks whose created_at, completed_at or approved_at fall in that
+window. Older buckets are left untouched, so a run costs roughly the
+number of tasks touched since the last one. /api/reports/timeseries then
+reads a handful of rollup rows instead of scanning tasks.
+
+Tasks deleted after their buckets were closed stay counted in them.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db
+from app.models import RollupWatermark, Task, TaskRollup
+
+GRANULARITIES = ('hour', 'day')
+WATERMARK_NAME = 'task_rollups'
+ROLLUP_LOOKBACK = timedelta(hours=1)
+MAX_RANGE = {'hour': timedelta(days=31), 'day': timedelta(days=366 * 3)}
+
+
+def bucket_start(value, granularity):
+    """Floor a timestamp to the start of its hour or day"""
+    if granularity == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _events(since):
+    """Yield (kind, team_id, owner_id, priority, at, duration_seconds) since a time"""
+    owner = db.func.coalesce(Task.assigned_to, Task.user_id)
+    columns = (Task.team_id, owner, Task.priority)
+
+    created = db.session.query(*columns, Task.created_at)
+    if since is not None:
+        created = created.filter(Task.created_at >= since)
+    for team_id, owner_id, priority, at in created.yield_per(1000):
+        yield 'created', team_id, owner_id, priority, at, 0.0
+
+    completed = db.session.query(*columns, Task.completed_at, Task.created_at).filter(Task.completed_at.isnot(None))
+    if since is not None:
+        completed = completed.filter(Task.completed_at >= since)
+    for team_id, owner_id, priority, at, started in completed.yield_per(1000):
+        yield 'completed', team_id, owner_id, priority, at, (at - started).total_seconds()
+
+    approved = db.session.query(*columns, Task.approved_at, Task.completed_at).filter(Task.approved_at.isnot(None))
+    if since is not None:
+        approved = approved.filter(Task.approved_at >= since)
+    for team_id, owner_id, priority, at, done in approved.yield_per(1000):
+        seconds = (at - done).total_seconds() if done else 0.0
+        yield 'approved', team_id, owner_id, priority, at, seconds
+
+
+def _aggregate(since):
+    """Build rollup rows for every bucket starting at or after `since`"""
+    buckets = {}
+    for kind, team_id, owner_id, priority, at, seconds in _events(since):
+        for granularity in GRANULARITIES:
+            key = (team_id, granularity, bucket_start(at, granularity), owner_id, priority)
+            row = buckets.get(key)
+            if row is None:
+                row = buckets[key] = {
+                    'team_id': team_id, 'granularity': granularity, 'bucket_start': key[2],
+                    'user_id': owner_id, 'priority': priority,
+                    'created_count': 0, 'completed_count': 0, 'approved_count': 0,
+                    'completion_seconds': 0.0, 'approval_seconds': 0.0
+                }
+            row[f'{kind}_count'] += 1
+            if kind == 'completed':
+                row['completion_seconds'] += seconds
+            elif kind == 'approved':
+                row['approval_seconds'] += seconds
+    return list(buckets.values())
+
+
+def run_task_rollups(rebuild=False):
+    """Refresh rollups since the last run (or from scratch); return rows written"""
+    started_at = datetime.utcnow()
+    watermark = db.session.get(RollupWatermark, WATERMARK_NAME)
+
+    since = None
+    if watermark is not None and not rebuild:
+        since = bucket_start(watermark.processed_at - ROLLUP_LOOKBACK, 'day')
+
+    stale = TaskRollup.query
+    if since is not None:
+        stale = stale.filter(TaskRollup.bucket_start >= since)
+    stale.delete(synchronize_session=False)
+
+    rows = _aggregate(since)
+    if rows:
+        db.session.execute(insert(TaskRollup), rows)
+
+    if watermark is None:
+        db.session.add(RollupWatermark(name=WATERMARK_NAME, processed_at=started_at))
+    else:
+        watermark.processed_at = started_at
+    db.session.commit()
+    return len(rows)
+
+
+def get_timeseries(start, end, granularity, user_id=None, priority=None):
+    """Sum rollups per bucket in [start, end) for the current team"""
+    query = (
+        db.session.query(
+            TaskRollup.bucket_start,
+            db.func.sum(TaskRollup.created_count),
+            db.func.sum(TaskRollup.completed_count),
+            db.func.sum(TaskRollup.approved_count),
+            db.func.sum(TaskRollup.completion_seconds),
+            db.func.sum(TaskRollup.approval_seconds)
+        )
+        .filter(
+            TaskRollup.granularity == granularity,
+            TaskRollup.bucket_start >= start,
+            TaskRollup.bucket_start < end
+        )
+        .group_by(TaskRollup.bucket_start)
+        .order_by(TaskRollup.bucket_start)
+    )
+    if user_id is not None:
+        query = query.filter(TaskRollup.user_id == user_id)
+    if priority is not None:
+        query = query.filter(TaskRollup.priority == priority)
+
+    series = []
+    for bucket, created, completed, approved, completion_seconds, approval_seconds in query:
+        series.append({
+            'bucket': bucket.isoformat(),
+            'created': created,
+            'completed': completed,
+            'approved': approved,
+            'avg_completion_seconds': completion_seconds / completed if completed else None,
+            'avg_approval_seconds': approval_seconds / approved if approved else None
+        })
+    return series
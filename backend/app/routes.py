@@ -1,21 +1,68 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, session
 from app import db
-from app.models import User, Task, Notification
+from app.models import User, Task, Notification, UserTaskStats, TaskTombstone
+from app.changes import CursorExpired, InvalidCursor, get_task_changes, DEFAULT_LIMIT
+from app.db_routing import use_primary
+from app.rollups import GRANULARITIES, MAX_RANGE, bucket_start, get_timeseries
+from app.idempotency import idempotent
+from app.tenancy import login_optional, remember_team, resolve_request_team
+from app.response_cache import cached_response, invalidate_responses
+from app.stats import (
+    apply_task_stats_change, get_user_task_stats, refresh_user_task_stats, task_stats_key
+)
+from sqlalchemy import update
 from sqlalchemy.exc import IntegrityError
-from datetime import datetime
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import datetime, timedelta, timezone
 
 main_bp = Blueprint('main', __name__)
 api_bp = Blueprint('api', __name__)
+api_bp.before_request(resolve_request_team)
+
+# Response cache TTLs (seconds)
+TEMPLATE_CACHE_TTL = 60
+READY_CACHE_TTL = 1
+TEAM_MEMBERS_CACHE_TTL = 5
+
+
+def task_response(task, status_code=200):
+    """Serialize a task with its version as the ETag"""
+    response = jsonify(task.to_dict())
+    response.status_code = status_code
+    response.set_etag(str(task.version))
+    return response
+
+
+def if_match_versions():
+    """Return the task versions listed in If-Match, or None if any version is accepted"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    return {int(tag) for tag in request.if_match.as_set() if tag.isdigit()}
+
+
+def precondition_failed(task):
+    """Response for a write against a stale task version
+
+    412 only applies to conditional requests; an unconditional write that
+    loses a race gets 409.
+    """
+    body = {'error': 'Task was modified by another request'}
+    if task is not None:
+        body['version'] = task.version
+    return jsonify(body), 409 if if_match_versions() is None else 412
 
 
 # Health check endpoints for Kubernetes
 @api_bp.route('/health', methods=['GET'])
+@login_optional
 def health_check():
     """Liveness probe - check if app is running"""
     return jsonify({"status": "healthy"}), 200
 
 
 @api_bp.route('/ready', methods=['GET'])
+@login_optional
+@cached_response(READY_CACHE_TTL)
 def readiness_check():
     """Readiness probe - check if app can serve traffic"""
     try:
@@ -28,90 +75,105 @@ def readiness_check():
 
 # Main Routes (for serving HTML)
 @main_bp.route('/')
+@cached_response(TEMPLATE_CACHE_TTL)
 def index():
     """Redirect to login page"""
     return render_template('login.html')
 
 
 @main_bp.route('/login')
+@cached_response(TEMPLATE_CACHE_TTL)
 def login():
     """Serve the login page"""
     return render_template('login.html')
 
 
 @main_bp.route('/register')
+@cached_response(TEMPLATE_CACHE_TTL)
 def register():
     """Serve the registration page"""
     return render_template('register.html')
 
 
 @main_bp.route('/dashboard')
+@cached_response(TEMPLATE_CACHE_TTL)
 def dashboard():
     """Serve the dashboard page"""
     return render_template('dashboard.html')
 
 
 @main_bp.route('/lead-dashboard')
+@cached_response(TEMPLATE_CACHE_TTL)
 def lead_dashboard():
     """Serve the team lead dashboard page"""
     return render_template('lead-dashboard.html')
 
 
 @main_bp.route('/member-dashboard')
+@cached_response(TEMPLATE_CACHE_TTL)
 def member_dashboard():
     """Serve the team member dashboard page"""
     return render_template('member-dashboard.html')
 
 
 @main_bp.route('/users')
+@cached_response(TEMPLATE_CACHE_TTL)
 def users_page():
     """Serve the users management page"""
     return render_template('users.html')
 
 
 @main_bp.route('/tasks')
+@cached_response(TEMPLATE_CACHE_TTL)
 def tasks_page():
     """Serve the tasks management page"""
     return render_template('tasks.html')
 
 
 @main_bp.route('/analytics')
+@cached_response(TEMPLATE_CACHE_TTL)
 def analytics():
     """Serve the analytics page"""
     return render_template('analytics.html')
 
 
 @main_bp.route('/settings')
+@cached_response(TEMPLATE_CACHE_TTL)
 def settings():
     """Serve the settings page"""
     return render_template('settings.html')
 
 
 @main_bp.route('/reports')
+@cached_response(TEMPLATE_CACHE_TTL)
 def reports():
     """Serve the reports page"""
     return render_template('reports.html')
 
 
 @main_bp.route('/profile')
+@cached_response(TEMPLATE_CACHE_TTL)
 def profile():
     """Serve the profile page"""
     return render_template('profile.html')
 
 
 @main_bp.route('/calendar')
+@cached_response(TEMPLATE_CACHE_TTL)
 def calendar():
     """Serve the calendar page"""
     return render_template('calendar.html')
 
 
 @main_bp.route('/notifications')
+@cached_response(TEMPLATE_CACHE_TTL)
 def notifications():
     """Serve the notifications page"""
     return render_template('notifications.html')
 
 
 @main_bp.route('/reset-password')
+@cached_response(TEMPLATE_CACHE_TTL)
 def reset_password_page():
     """Serve the password reset page"""
     return render_template('reset-password.html')
@@ -134,7 +196,16 @@ def get_user(user_id):
     return jsonify(user.to_dict()), 200
 
 
+@api_bp.route('/users/<int:user_id>/stats', methods=['GET'])
+def get_user_stats(user_id):
+    """Get task counters for a user"""
+    if not User.query.get(user_id):
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(get_user_task_stats(user_id)), 200
+
+
 @api_bp.route('/users', methods=['POST'])
+@idempotent
 def create_user():
     """Create a new user (Team Lead creates with default password)"""
     data = request.get_json()
@@ -153,6 +224,7 @@ def create_user():
         )
         db.session.add(user)
         db.session.commit()
+        invalidate_responses('users')
         # Return user data with password_reset_required flag
         user_data = user.to_dict()
         user_data['password_reset_required'] = True  # Frontend will handle this
@@ -182,6 +254,7 @@ def update_user(user_id):
             user.full_name = data['full_name']
         
         db.session.commit()
+        invalidate_responses('users')
         return jsonify(user.to_dict()), 200
     except IntegrityError:
         db.session.rollback()
@@ -199,16 +272,29 @@ def delete_user(user_id):
         return jsonify({'error': 'User not found'}), 404
     
     try:
+        # Owners whose task counters change: creators of tasks assigned to this
+        # user take them back, assignees lose tasks created by this user
+        affected_owners = [t.user_id for t in Task.query.filter_by(assigned_to=user_id)]
+        created_tasks = Task.query.filter_by(user_id=user_id).all()
+        affected_owners += [t.assigned_to for t in created_tasks]
+        
         # Delete notifications related to this user
         Notification.query.filter_by(user_id=user_id).delete()
         
-        # Update or delete tasks where user is assigned
-        Task.query.filter_by(assigned_to=user_id).update({'assigned_to': None})
-        Task.query.filter_by(assigned_by=user_id).update({'assigned_by': None})
+        # Update or delete tasks where user is assigned (bump updated_at and
+        # version so the change feed and If-Match see the change)
+        changed = {'updated_at': datetime.utcnow(), 'version': Task.version + 1}
+        Task.query.filter_by(assigned_to=user_id).update(dict(changed, assigned_to=None))
+        Task.query.filter_by(assigned_by=user_id).update(dict(changed, assigned_by=None))
         
         # Now delete the user (cascade will handle tasks created by user)
+        db.session.add_all(TaskTombstone(task_id=t.id) for t in created_tasks)
+        UserTaskStats.query.filter_by(user_id=user_id).delete()
         db.session.delete(user)
+        db.session.flush()
+        refresh_user_task_stats(uid for uid in affected_owners if uid != user_id)
         db.session.commit()
+        invalidate_responses('users')
         return jsonify({'message': 'User deleted successfully'}), 200
     except Exception as e:
         db.session.rollback()
@@ -229,16 +315,32 @@ def get_tasks():
     return jsonify([task.to_dict() for task in tasks]), 200
 
 
+@api_bp.route('/tasks/changes', methods=['GET'])
+def get_task_changes_feed():
+    """Get tasks changed and deleted since a cursor (delta sync)"""
+    since = request.args.get('since', '')
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    # A lagging replica could let the cursor pass rows it has not replayed yet
+    use_primary()
+    try:
+        return jsonify(get_task_changes(since, limit)), 200
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except CursorExpired:
+        return jsonify({'error': 'Cursor expired, sync again without since'}), 410
+
+
 @api_bp.route('/tasks/<int:task_id>', methods=['GET'])
 def get_task(task_id):
     """Get a specific task by ID"""
-    task = Task.query.get(task_id)
+    task = Task.query.filter_by(id=task_id).first()
     if not task:
         return jsonify({'error': 'Task not found'}), 404
-    return jsonify(task.to_dict()), 200
+    return task_response(task).make_conditional(request)
 
 
 @api_bp.route('/tasks', methods=['POST'])
+@idempotent
 def create_task():
     """Create a new task"""
     data = request.get_json()
@@ -261,8 +363,9 @@ def create_task():
             due_date=datetime.fromisoformat(data['due_date']) if 'due_date' in data else None
         )
         db.session.add(task)
+        apply_task_stats_change(None, task_stats_key(task))
         db.session.commit()
-        return jsonify(task.to_dict()), 201
+        return task_response(task, 201)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -271,11 +374,16 @@ def create_task():
 @api_bp.route('/tasks/<int:task_id>', methods=['PUT'])
 def update_task(task_id):
     """Update a task"""
-    task = Task.query.get(task_id)
+    task = Task.query.filter_by(id=task_id).first()
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     
+    versions = if_match_versions()
+    if versions is not None and task.version not in versions:
+        return precondition_failed(task)
+    
     data = request.get_json()
+    stats_before = task_stats_key(task)
     try:
         if 'title' in data:
             task.title = data['title']
@@ -288,8 +396,12 @@ def update_task(task_id):
         if 'due_date' in data:
             task.due_date = datetime.fromisoformat(data['due_date']) if data['due_date'] else None
         
+        apply_task_stats_change(stats_before, task_stats_key(task))
         db.session.commit()
-        return jsonify(task.to_dict()), 200
+        return task_response(task)
+    except StaleDataError:
+        db.session.rollback()
+        return precondition_failed(Task.query.filter_by(id=task_id).first())
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -298,11 +410,13 @@ def update_task(task_id):
 @api_bp.route('/tasks/<int:task_id>', methods=['DELETE'])
 def delete_task(task_id):
     """Delete a task"""
-    task = Task.query.get(task_id)
+    task = Task.query.filter_by(id=task_id).first()
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     
     try:
+        apply_task_stats_change(task_stats_key(task), None)
+        db.session.add(TaskTombstone(task_id=task.id))
         db.session.delete(task)
         db.session.commit()
         return jsonify({'message': 'Task deleted successfully'}), 200
@@ -313,6 +427,8 @@ def delete_task(task_id):
 
 # API Routes - Authentication
 @api_bp.route('/auth/register', methods=['POST'])
+@login_optional
+@idempotent
 def register_user():
     """Register a new user"""
     data = request.get_json()
@@ -320,11 +436,11 @@ def register_user():
     if not data or not all(k in data for k in ('username', 'email', 'full_name', 'role')):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    # Check if user already exists
-    if User.query.filter_by(username=data['username']).first():
+    # Check if user already exists (usernames and emails are unique across teams)
+    if User.query.filter_by(username=data['username']).execution_options(all_teams=True).first():
         return jsonify({'error': 'Username already exists'}), 409
     
-    if User.query.filter_by(email=data['email']).first():
+    if User.query.filter_by(email=data['email']).execution_options(all_teams=True).first():
         return jsonify({'error': 'Email already exists'}), 409
     
     try:
@@ -337,17 +453,22 @@ def register_user():
         )
         db.session.add(user)
         db.session.commit()
+        invalidate_responses('users')
         
         return jsonify({
             'message': 'Registration successful',
             'user': user.to_dict()
         }), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Username or email already exists'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @api_bp.route('/auth/login', methods=['POST'])
+@login_optional
 def login_user():
     """Authenticate existing user and return user info"""
     data = request.get_json()
@@ -355,8 +476,10 @@ def login_user():
     if not data or not all(k in data for k in ('username', 'password', 'role')):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    # Check if user exists with matching username and role
-    user = User.query.filter_by(username=data['username'], role=data['role']).first()
+    # Check if user exists with matching username and role, in any team
+    user = User.query.filter_by(
+        username=data['username'], role=data['role']
+    ).execution_options(all_teams=True).first()
     
     if not user:
         return jsonify({'error': 'Invalid username or password'}), 401
@@ -365,6 +488,9 @@ def login_user():
     if user.password != data['password']:
         return jsonify({'error': 'Invalid username or password'}), 401
     
+    # Later requests run in this user's team
+    remember_team(user)
+    
     user_data = user.to_dict()
     # Check if this is a newly created user (password age - simple check)
     # For now, mark users without a reset as needing reset if they were just created
@@ -375,8 +501,17 @@ def login_user():
     }), 200
 
 
+@api_bp.route('/auth/logout', methods=['POST'])
+@login_optional
+def logout_user():
+    """End the session started by login"""
+    session.clear()
+    return jsonify({'message': 'Logout successful'}), 200
+
+
 # API Routes - Task Assignment (Team Lead only)
 @api_bp.route('/tasks/assign', methods=['POST'])
+@idempotent
 def assign_task():
     """Assign a task to a team member"""
     data = request.get_json()
@@ -415,8 +550,9 @@ def assign_task():
         )
         db.session.add(notification)
         
+        apply_task_stats_change(None, task_stats_key(task))
         db.session.commit()
-        return jsonify(task.to_dict()), 201
+        return task_response(task, 201)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -426,11 +562,16 @@ def assign_task():
 @api_bp.route('/tasks/<int:task_id>/complete', methods=['PUT'])
 def complete_task(task_id):
     """Mark task as completed and upload result"""
-    task = Task.query.get(task_id)
+    task = Task.query.filter_by(id=task_id).first()
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     
+    versions = if_match_versions()
+    if versions is not None and task.version not in versions:
+        return precondition_failed(task)
+    
     data = request.get_json()
+    stats_before = task_stats_key(task)
     
     try:
         task.completed = True
@@ -447,8 +588,12 @@ def complete_task(task_id):
             )
             db.session.add(notification)
         
+        apply_task_stats_change(stats_before, task_stats_key(task))
         db.session.commit()
-        return jsonify(task.to_dict()), 200
+        return task_response(task)
+    except StaleDataError:
+        db.session.rollback()
+        return precondition_failed(Task.query.filter_by(id=task_id).first())
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -458,10 +603,6 @@ def complete_task(task_id):
 @api_bp.route('/tasks/<int:task_id>/approve', methods=['PUT'])
 def approve_task(task_id):
     """Approve a completed task"""
-    task = Task.query.get(task_id)
-    if not task:
-        return jsonify({'error': 'Task not found'}), 404
-    
     data = request.get_json()
     user_id = data.get('user_id')
     
@@ -470,9 +611,34 @@ def approve_task(task_id):
     if not user or user.role != 'lead':
         return jsonify({'error': 'Only team leads can approve tasks'}), 403
     
+    # Single conditional UPDATE: only a completed task (at the expected
+    # version, if If-Match was sent) moves to approved
+    stmt = (
+        update(Task)
+        .where(Task.id == task_id, Task.status == 'completed')
+        .values(
+            approved=True,
+            status='approved',
+            version=Task.version + 1,
+            approved_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+        .returning(Task)
+    )
+    versions = if_match_versions()
+    if versions is not None:
+        stmt = stmt.where(Task.version.in_(versions))
+    
     try:
-        task.approved = True
-        task.status = 'approved'
+        task = db.session.execute(stmt).scalars().first()
+        if task is None:
+            db.session.rollback()
+            current = Task.query.filter_by(id=task_id).first()
+            if not current:
+                return jsonify({'error': 'Task not found'}), 404
+            if current.status != 'completed':
+                return jsonify({'error': 'Only completed tasks can be approved'}), 409
+            return precondition_failed(current)
         
         # Notify team member
         if task.assigned_to:
@@ -483,8 +649,10 @@ def approve_task(task_id):
             )
             db.session.add(notification)
         
+        owner_id = task_stats_key(task)[0]
+        apply_task_stats_change((owner_id, 'completed'), (owner_id, 'approved'))
         db.session.commit()
-        return jsonify(task.to_dict()), 200
+        return task_response(task)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -524,7 +692,7 @@ def get_notifications(user_id):
 @api_bp.route('/notifications/<int:notification_id>/read', methods=['PUT'])
 def mark_notification_read(notification_id):
     """Mark a notification as read"""
-    notification = Notification.query.get(notification_id)
+    notification = Notification.query.filter_by(id=notification_id).first()
     if not notification:
         return jsonify({'error': 'Notification not found'}), 404
     
@@ -567,8 +735,50 @@ def reset_password():
         return jsonify({'error': str(e)}), 500
 
 
+# API Routes - Reports
+def _parse_utc(value):
+    """Parse an ISO date; timestamps with an offset are converted to naive UTC"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@api_bp.route('/reports/timeseries', methods=['GET'])
+def get_reports_timeseries():
+    """Get task trends per hour/day from precomputed rollups"""
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    
+    try:
+        end = _parse_utc(request.args['end']) if 'end' in request.args else datetime.utcnow()
+        start = _parse_utc(request.args['start']) if 'start' in request.args else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    # Include the bucket that contains start instead of dropping it
+    start = bucket_start(start, granularity)
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+    if end - start > MAX_RANGE[granularity]:
+        return jsonify({'error': f'Range too large for {granularity} granularity'}), 400
+    
+    series = get_timeseries(
+        start, end, granularity,
+        user_id=request.args.get('user_id', type=int),
+        priority=request.args.get('priority')
+    )
+    return jsonify({
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': series
+    }), 200
+
+
 # API Routes - Team Members (Team Lead view)
 @api_bp.route('/users/members', methods=['GET'])
+@cached_response(TEAM_MEMBERS_CACHE_TTL, groups=('users',))
 def get_team_members():
     """Get all team members"""
     members = User.query.filter_by(role='member').all()
@@ -577,6 +787,7 @@ def get_team_members():
 
 # Health check endpoint
 @api_bp.route('/health', methods=['GET'])
+@login_optional
 def health():
     """Health check endpoint"""
     return jsonify({'status': 'ok', 'message': 'API is running'}), 200
@@ -0,0 +1,104 @@
+"""
+Materialized per-user task counters (user_task_stats table)
+
+A task is counted against its owner: the assignee if it has one,
+otherwise the user who created it. Route handlers capture the
+(owner, status) key of a task before and after a write and call
+apply_task_stats_change() in the same transaction, so the counters
+commit or roll back together with the task itself.
+"""
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Task, UserTaskStats
+
+STAT_STATUSES = ('pending', 'in_progress', 'completed', 'approved')
+
+
+def task_stats_key(task):
+    """Return the (owner_id, status) pair a task is counted under"""
+    owner_id = task.assigned_to or task.user_id
+    return (owner_id, task.status or 'pending')
+
+
+def _ensure_stats_row(user_id):
+    """Make sure a counter row exists for the user"""
+    if db.session.get(UserTaskStats, user_id) is not None:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserTaskStats(
+                user_id=user_id, pending=0, in_progress=0, completed=0, approved=0
+            ))
+    except IntegrityError:
+        # Another transaction created the row first
+        pass
+
+
+def _bump(user_id, status, delta):
+    """Atomically add delta to one counter of a user"""
+    if not user_id or status not in STAT_STATUSES:
+        return
+    _ensure_stats_row(user_id)
+    column = getattr(UserTaskStats, status)
+    UserTaskStats.query.filter_by(user_id=user_id).update(
+        {column: column + delta, UserTaskStats.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+
+
+def apply_task_stats_change(before, after):
+    """Move a task between counters; None means created/deleted"""
+    if before == after:
+        return
+    if before:
+        _bump(before[0], before[1], -1)
+    if after:
+        _bump(after[0], after[1], 1)
+
+
+def get_user_task_stats(user_id):
+    """Return the counters for a user as a dict (O(1) primary key read)"""
+    stats = db.session.get(UserTaskStats, user_id)
+    if stats is None:
+        stats = UserTaskStats(user_id=user_id, pending=0, in_progress=0, completed=0, approved=0)
+    return stats.to_dict()
+
+
+def _count_tasks(user_ids=None):
+    """Count tasks per (owner, status) straight from the tasks table"""
+    owner = db.func.coalesce(Task.assigned_to, Task.user_id)
+    query = db.session.query(owner, Task.status, db.func.count(Task.id)).group_by(owner, Task.status)
+    if user_ids is not None:
+        query = query.filter(owner.in_(user_ids))
+    counts = {}
+    for owner_id, status, count in query:
+        if status in STAT_STATUSES:
+            counts.setdefault(owner_id, {})[status] = count
+    return counts
+
+
+def refresh_user_task_stats(user_ids):
+    """Recompute the counters of a few users inside the current transaction"""
+    user_ids = [uid for uid in set(user_ids) if uid]
+    if not user_ids:
+        return
+    counts = _count_tasks(user_ids)
+    for user_id in user_ids:
+        _ensure_stats_row(user_id)
+        values = {status: counts.get(user_id, {}).get(status, 0) for status in STAT_STATUSES}
+        values['updated_at'] = datetime.utcnow()
+        UserTaskStats.query.filter_by(user_id=user_id).update(values, synchronize_session=False)
+
+
+def rebuild_user_task_stats():
+    """Rebuild the whole user_task_stats table from the tasks table"""
+    counts = _count_tasks()
+    UserTaskStats.query.delete(synchronize_session=False)
+    for user_id, values in counts.items():
+        db.session.add(UserTaskStats(
+            user_id=user_id,
+            **{status: values.get(status, 0) for status in STAT_STATUSES}
+        ))
+    db.session.commit()
+    return len(counts)
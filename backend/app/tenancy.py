@@ -0,0 +1,97 @@
+"""
+Team (tenant) scoping
+
+Every API request runs on behalf of one team: the logged-in user's, kept
+in the signed Flask session cookie. Clients may echo it in the X-Team-ID
+header, but a header naming any other team is rejected. Only views marked
+@login_optional (health checks, login, registration) run without a
+session, in DEFAULT_TEAM_ID. While a request is active, every ORM SELECT,
+UPDATE and DELETE touching a team-scoped model (User, Task, Notification,
+TaskTombstone) gets a `team_id = <team>` criteria added, and new rows
+default to the request's team. Code outside a request (CLI commands)
+sees all teams.
+"""
+from flask import current_app, g, has_app_context, has_request_context, jsonify, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+TEAM_HEADER = 'X-Team-ID'
+DEFAULT_TEAM_ID = 1
+
+
+def default_team_id():
+    """Team used when a request does not name one"""
+    if has_app_context():
+        return current_app.config.get('DEFAULT_TEAM_ID', DEFAULT_TEAM_ID)
+    return DEFAULT_TEAM_ID
+
+
+def current_team_id():
+    """Team of the current request, or None outside a request"""
+    if has_request_context():
+        return g.get('team_id')
+    return None
+
+
+def team_id_for_insert():
+    """Column default for team_id on new rows"""
+    team_id = current_team_id()
+    return default_team_id() if team_id is None else team_id
+
+
+def remember_team(user):
+    """Bind the client's session to the team of the user who logged in"""
+    session.clear()
+    session['user_id'] = user.id
+    session['team_id'] = user.team_id
+
+
+def login_optional(view):
+    """Let a view run without a login session, in DEFAULT_TEAM_ID"""
+    view.login_optional = True
+    return view
+
+
+def resolve_request_team():
+    """before_request hook: bind the request to the acting user's team"""
+    if request.method == 'OPTIONS':
+        return None
+    requested = request.headers.get(TEAM_HEADER)
+    if requested is not None:
+        try:
+            requested = int(requested)
+        except ValueError:
+            requested = 0
+        if requested <= 0:
+            return jsonify({'error': f'{TEAM_HEADER} must be a positive integer'}), 400
+
+    team_id = session.get('team_id')
+    if team_id is None:
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'login_optional', False):
+            return jsonify({'error': 'Login required'}), 401
+        team_id = default_team_id()
+        if requested is not None and requested != team_id:
+            return jsonify({'error': 'Log in to access this team'}), 401
+    elif requested is not None and requested != team_id:
+        return jsonify({'error': 'Not a member of this team'}), 403
+
+    g.team_id = team_id
+    return None
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def scope_to_team(execute_state):
+    """Restrict ORM statements to the current request's team"""
+    team_id = current_team_id()
+    if team_id is None or execute_state.execution_options.get('all_teams', False):
+        return
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+        return
+
+    from app.models import TeamScoped
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(TeamScoped, lambda cls: cls.team_id == team_id, include_aliases=True)
+    )
@@ -2,15 +2,11 @@
 Main entry point for the Flask application
 """
 
-from flask import Flask
-from app import create_app, db
+from app import create_app
 import os
 
 app = create_app()
 
-with app.app_context():
-    db.create_all()
-
 if __name__ == '__main__':
     debug_mode = os.environ.get('FLASK_ENV') != 'production'
 
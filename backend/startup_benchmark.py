@@ -0,0 +1,84 @@
+"""
+Startup-time benchmark: measures how long a backend process takes to
+import the app and to answer /api/ready with 200 (boot-to-ready).
+
+    python startup_benchmark.py                # 5 runs against DATABASE_URL
+    python startup_benchmark.py --runs 10 --port 8899
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "import run; "
+    "print(time.perf_counter() - start)"
+)
+
+SERVE_SNIPPET = (
+    "import os; from run import app; "
+    "app.run(host='127.0.0.1', port=int(os.environ['BENCH_PORT']))"
+)
+
+
+def measure_import(env):
+    """Seconds spent importing run.py (app factory included) in a fresh interpreter"""
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SNIPPET], env=env, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_boot_to_ready(env, port, timeout):
+    """Seconds from process spawn until /api/ready returns 200"""
+    url = f'http://127.0.0.1:{port}/api/ready'
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-c', SERVE_SNIPPET],
+        env=dict(env, BENCH_PORT=str(port)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f'{url} not ready after {timeout}s')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summarize(name, samples):
+    """Print min / median / max for a list of timings"""
+    print(f"{name:<15} min {min(samples) * 1000:8.1f} ms   "
+          f"median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"max {max(samples) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.abspath(__file__))
+
+    imports = [measure_import(env) for _ in range(args.runs)]
+    boots = [measure_boot_to_ready(env, args.port, args.timeout) for _ in range(args.runs)]
+
+    summarize('import app', imports)
+    summarize('boot-to-ready', boots)
+
+
+if __name__ == '__main__':
+    main()
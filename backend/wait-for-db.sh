@@ -1,11 +1,15 @@
 #!/bin/sh
 
+DB_HOST=${DB_HOST:-postgres}
+DB_PORT=${DB_PORT:-5432}
+DB_WAIT_INTERVAL=${DB_WAIT_INTERVAL:-0.5}
+
 echo "Waiting for postgres..."
 
-while ! nc -z postgres 5432; do
-  sleep 2
+while ! nc -z "$DB_HOST" "$DB_PORT"; do
+  sleep "$DB_WAIT_INTERVAL"
 done
 
 echo "PostgreSQL started"
 
-python run.py
+exec python run.py
@@ -0,0 +1,37 @@
+/**
+ * API requests - Include before any script that calls the API
+ *
+ * Sends the logged-in user's team (X-Team-ID) with every /api request.
+ * The backend takes the team from the login session and rejects a header
+ * naming any other team. A 401 outside /api/auth/ means the session is
+ * gone, so the user is sent back to the login page.
+ */
+
+const nativeFetch = window.fetch.bind(window);
+
+window.fetch = (resource, options = {}) => {
+    const url = typeof resource === 'string' ? resource : resource.url;
+    const teamId = sessionStorage.getItem('teamId');
+
+    if (teamId && new URL(url, window.location.origin).pathname.startsWith('/api/')) {
+        const headers = new Headers(options.headers || (resource instanceof Request ? resource.headers : undefined));
+        headers.set('X-Team-ID', teamId);
+        options = { ...options, headers };
+    }
+
+    return nativeFetch(resource, options).then((response) => {
+        // Session expired or missing: log in again
+        if (response.status === 401 && !url.includes('/api/auth/')) {
+            sessionStorage.clear();
+            window.location.href = '/login';
+        }
+        return response;
+    });
+};
+
+// End the server session, then the browser one
+function endSession() {
+    return nativeFetch('/api/auth/logout', { method: 'POST' })
+        .catch(() => {})
+        .finally(() => sessionStorage.clear());
+}
@@ -16,8 +16,9 @@ function checkAuthentication() {
 
 function logout() {
     if (confirm('Are you sure you want to logout?')) {
-        sessionStorage.clear();
-        window.location.href = '/login';
+        endSession().then(() => {
+            window.location.href = '/login';
+        });
     }
 }
 
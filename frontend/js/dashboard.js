@@ -124,13 +124,15 @@ async function toggleTask(taskId) {
         const updateResponse = await fetch(`${API_URL}/tasks/${taskId}`, {
             method: 'PUT',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'If-Match': response.headers.get('ETag') || '*'
             },
             body: JSON.stringify({
                 completed: !task.completed
             })
         });
 
+        if (updateResponse.status === 412) throw new Error('Task was changed by someone else, please retry');
         if (!updateResponse.ok) throw new Error('Failed to update task');
 
         // Reload dashboard
@@ -20,8 +20,9 @@ function checkAuth() {
 // Logout function
 function logout() {
     if (confirm('Are you sure you want to logout?')) {
-        sessionStorage.clear();
-        window.location.href = '/login';
+        endSession().then(() => {
+            window.location.href = '/login';
+        });
     }
 }
 